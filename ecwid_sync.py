@@ -1,13 +1,15 @@
 import os
-import requests
+import asyncio
+import aiohttp
+import orjson
 import csv
+import functools
+import re
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 import gspread
-from gspread.utils import rowcol_to_a1
-import pandas as pd
-import numpy as np
+from gspread.utils import rowcol_to_a1, a1_to_rowcol, absolute_range_name
 
 # Load credentials from .env
 load_dotenv()
@@ -19,6 +21,16 @@ GOOGLE_SHEET_NAME = os.getenv("NEW_SHEET_NAME", "Ecwid Data Source")
 GOOGLE_ORDERS_WORKSHEET_NAME = os.getenv("GOOGLE_ORDERS_WORKSHEET_NAME", "Orders Data")
 GOOGLE_LOG_WORKSHEET_NAME = os.getenv("GOOGLE_LOG_WORKSHEET_NAME", "Update Log")
 
+# Sync state is kept in spare cells of column Z on the log worksheet
+SYNC_STATE_COLUMN_COUNT = 26
+WATERMARK_CELL = "Z1"  # Highest order number written to the orders worksheet
+ORDERS_NEXT_ROW_CELL = "Z2"  # First empty row of the orders worksheet
+LOG_NEXT_ROW_CELL = "Z3"  # First empty row of the log worksheet
+CREATED_FROM_CELL = "Z4"  # Latest createDate written, in Ecwid's createdFrom format
+SYNC_STATE_LAST_ROW = a1_to_rowcol(CREATED_FROM_CELL)[0]
+# Extra empty rows added whenever a worksheet grid has to grow, so most runs need no resize
+GRID_ROW_HEADROOM = 500
+
 INITIAL_FETCH_DATE_STR = "2025-03-17 00:00:00 +0000"
 
 if not store_id or not secret_token:
@@ -27,6 +39,11 @@ if not store_id or not secret_token:
 # --- Ecwid API Setup ---
 url = f"https://app.ecwid.com/api/v3/{store_id}/orders"
 headers = {"Authorization": f"Bearer {secret_token}"}
+ECWID_PAGE_LIMIT = 100
+ECWID_MAX_CONNECTIONS = 20
+ECWID_MAX_RETRIES = 3
+ECWID_BACKOFF_FACTOR = 0.3
+ECWID_RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 ECWID_DATE_FORMATS = [
     "%Y-%m-%d %H:%M:%S %z",
@@ -34,32 +51,171 @@ ECWID_DATE_FORMATS = [
     "%Y-%m-%d"
 ]
 OUTPUT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S %Z%z"
+SHEET_DATE_FORMAT = "%d-%m-%Y %H:%M:%S"
+LAGOS = ZoneInfo("Africa/Lagos")
+UTC = timezone.utc
 
 # --- FIXED: Moved function definition to the top ---
+# Orders placed in the same second share a createDate, so each unique string is parsed once
+@functools.lru_cache(maxsize=None)
 def parse_and_standardize_date(date_str):
     if not date_str:
         return None
+    _strptime = datetime.strptime
+    # ECWID_DATE_FORMATS[0] is what Ecwid returns in practice, so it is tried first
     for fmt in ECWID_DATE_FORMATS:
         try:
-            dt_obj = datetime.strptime(date_str, fmt)
+            dt_obj = _strptime(date_str, fmt)
             if dt_obj.tzinfo is None:
-                dt_obj = dt_obj.replace(tzinfo=timezone.utc)
-            dt_obj = dt_obj.astimezone(ZoneInfo("Africa/Lagos"))
+                dt_obj = dt_obj.replace(tzinfo=UTC)
+            dt_obj = dt_obj.astimezone(LAGOS)
             return dt_obj
         except ValueError:
             continue
     return None
+
+def format_create_dates(raw_dates):
+    """Formats a batch of Ecwid createDate strings as Lagos local time for the sheet.
+
+    Returns the formatted strings and the latest parsed createDate, or None if nothing parsed.
+    """
+    if not raw_dates:
+        return [], None
+    # pandas is slow to import, so runs that find no new orders never load it
+    import pandas as pd
+
+    parsed = pd.to_datetime(pd.Series(raw_dates, dtype=object), format=ECWID_DATE_FORMATS[0], utc=True, errors="coerce", cache=True)
+    formatted = parsed.dt.tz_convert(LAGOS.key).dt.strftime(SHEET_DATE_FORMAT)
+    latest_parsed = parsed.max()
+    latest_create_date = None if pd.isna(latest_parsed) else latest_parsed.to_pydatetime()
+
+    # Anything the vectorized pass could not parse goes through the slower per-format parser
+    formatted_dates = []
+    for raw_date, formatted_date in zip(raw_dates, formatted):
+        if not isinstance(formatted_date, str):
+            parsed_date = parse_and_standardize_date(raw_date)
+            formatted_date = parsed_date.strftime(SHEET_DATE_FORMAT) if parsed_date else raw_date
+            if parsed_date and (latest_create_date is None or parsed_date > latest_create_date):
+                latest_create_date = parsed_date
+        formatted_dates.append(formatted_date)
+    return formatted_dates, latest_create_date
     
+# Each alternative scans the whole name, so earlier groups win when a name matches several
+_OPT_RE = re.compile(
+    r"^(?:"
+    r"(?=.*(?P<color>colou?r|coloue|cours))"
+    r"|(?=.*(?P<size>siz(?:e|ing|s)))"
+    r"|(?=.*(?P<category>categor(?:y|ies)|caregory|catgory))"
+    r"|(?=.*(?P<designer_category>designer))"
+    r"|(?=.*(?P<thickness>thickness))"
+    r")",
+    re.IGNORECASE | re.DOTALL,
+)
+# Lowercases ASCII letters and turns spaces into underscores in a single pass
+_OPT_TABLE = str.maketrans({chr(c): chr(c + 32) for c in range(ord("A"), ord("Z") + 1)} | {" ": "_"})
+
 # --- FIXED: Moved function definition to the top ---
+@functools.lru_cache(maxsize=4096)
 def normalize_option(name):
     """Normalizes product option names for consistent mapping."""
-    name = name.lower()
-    if any(x in name for x in ["color", "colour", "coloue", "colours", "cours"]): return "color"
-    if any(x in name for x in ["size", "sizing", "sizs"]): return "size"
-    if any(x in name for x in ["category", "caregory", "categories", "catgory"]): return "category"
-    if any(x in name for x in ["designer"]): return "designer_category"
-    if any(x in name for x in ["thickness"]): return "thickness"
-    return name.replace(" ", "_")
+    match = _OPT_RE.match(name)
+    if match:
+        return match.lastgroup
+    return name.translate(_OPT_TABLE)
+
+async def fetch_page(session, offset, params_base):
+    """Fetches a single page of orders starting at the given offset."""
+    params = {**params_base, "offset": offset, "limit": ECWID_PAGE_LIMIT}
+    for attempt in range(ECWID_MAX_RETRIES + 1):
+        is_last_attempt = attempt == ECWID_MAX_RETRIES
+        delay = ECWID_BACKOFF_FACTOR * 2 ** attempt
+        try:
+            async with session.get(url, params=params) as response:
+                if response.status in ECWID_RETRY_STATUSES and not is_last_attempt:
+                    # Ecwid sends Retry-After with 429s; otherwise back off exponentially
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = float(retry_after)
+                else:
+                    response.raise_for_status()
+                    return await response.json(loads=orjson.loads)
+        except aiohttp.ClientResponseError:
+            # Statuses outside ECWID_RETRY_STATUSES will not change on a retry
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Dropped connections and timeouts get the same backoff as throttled responses
+            if is_last_attempt:
+                raise
+        await asyncio.sleep(delay)
+
+def ecwid_session():
+    """Opens an aiohttp session for the Ecwid API with a capped connection pool."""
+    connector = aiohttp.TCPConnector(limit=ECWID_MAX_CONNECTIONS)
+    return aiohttp.ClientSession(headers=headers, connector=connector)
+
+async def fetch_all(params_base):
+    """Fetches every page matching params_base, requesting pages after the first concurrently."""
+    async with ecwid_session() as session:
+        # The first page tells us how many orders there are in total
+        first_page = await fetch_page(session, 0, params_base)
+        orders = first_page.get("items", [])
+        total = first_page.get("total", len(orders))
+
+        tasks = [fetch_page(session, offset, params_base) for offset in range(ECWID_PAGE_LIMIT, total, ECWID_PAGE_LIMIT)]
+        pages = await asyncio.gather(*tasks)
+        for page in pages:
+            orders.extend(page.get("items", []))
+    return orders
+
+async def fetch_newer_than(order_number, params_base):
+    """Fetches orders numbered above order_number, newest first, stopping at the first already-synced order."""
+    params_base = {**params_base, "sortBy": "orderNumber", "sortOrder": "desc"}
+    new_orders = []
+    # An order placed mid-scan shifts later pages down by one, so the same order can show up twice
+    seen_order_numbers = set()
+    async with ecwid_session() as session:
+        offset = 0
+        while True:
+            page = await fetch_page(session, offset, params_base)
+            orders = page.get("items", [])
+            new_batch = [order for order in orders if (order.get("orderNumber") or 0) > order_number]
+            for order in new_batch:
+                if order["orderNumber"] not in seen_order_numbers:
+                    seen_order_numbers.add(order["orderNumber"])
+                    new_orders.append(order)
+
+            # A short page means the end of the results; a partly-new page means we crossed the watermark
+            if len(orders) < ECWID_PAGE_LIMIT or len(new_batch) < len(orders):
+                break
+            offset += ECWID_PAGE_LIMIT
+
+    # Downstream code expects oldest first
+    new_orders.reverse()
+    return new_orders
+
+def sort_rows_by_order_number(rows):
+    """Returns flattened rows ordered by order number, oldest first."""
+    if not rows:
+        return rows
+    import numpy as np
+
+    # Rows without an integer order number sort first, as -1
+    order_numbers = np.fromiter(
+        (row[1] if isinstance(row[1], int) else -1 for row in rows), dtype=np.int64, count=len(rows)
+    )
+    return [rows[i] for i in np.argsort(order_numbers, kind="stable").tolist()]
+
+def row_capacity_request(worksheet, last_row):
+    """Returns an appendDimension request that makes room for last_row, or None if the grid already fits."""
+    if worksheet.row_count >= last_row:
+        return None
+    return {
+        "appendDimension": {
+            "sheetId": worksheet.id,
+            "dimension": "ROWS",
+            "length": last_row - worksheet.row_count + GRID_ROW_HEADROOM,
+        }
+    }
 
 # Define FIXED output fields for the FLATTENED (Orders Data) sheet
 fieldnames_flattened = [
@@ -70,9 +226,6 @@ header_flattened = [
     "ORDER DATETIME", "ORDER NO", "PRODUCT NAME", "PRODUCT CATEGORY", "PRODUCT SIZE", "PRODUCT COLOUR"
 ]
 
-ID_COLUMNS = ["product_name"]
-NUMERIC_COLUMNS = ['order_number']
-
 # --- Google Sheet Connection Setup ---
 print(f"Connecting to Google Sheet '{GOOGLE_SHEET_NAME}'...")
 try:
@@ -83,6 +236,7 @@ except gspread.exceptions.SpreadsheetNotFound:
     spreadsheet = gc.create(GOOGLE_SHEET_NAME)
     print(f"Created new spreadsheet '{GOOGLE_SHEET_NAME}'.")
 
+orders_worksheet_created = False
 try:
     orders_worksheet = spreadsheet.worksheet(GOOGLE_ORDERS_WORKSHEET_NAME)
     print(f"Found existing worksheet: '{GOOGLE_ORDERS_WORKSHEET_NAME}'.")
@@ -90,6 +244,7 @@ except gspread.exceptions.WorksheetNotFound:
     print(f"Worksheet '{GOOGLE_ORDERS_WORKSHEET_NAME}' not found. Creating a new one...")
     orders_worksheet = spreadsheet.add_worksheet(title=GOOGLE_ORDERS_WORKSHEET_NAME, rows="1", cols=len(header_flattened))
     orders_worksheet.update([header_flattened])
+    orders_worksheet_created = True
     print(f"Created new worksheet: '{GOOGLE_ORDERS_WORKSHEET_NAME}' with headers.")
 
 try:
@@ -97,72 +252,68 @@ try:
     print(f"Found existing log worksheet: '{GOOGLE_LOG_WORKSHEET_NAME}'.")
 except gspread.exceptions.WorksheetNotFound:
     print(f"Log worksheet '{GOOGLE_LOG_WORKSHEET_NAME}' not found. Creating a new one...")
-    log_worksheet = spreadsheet.add_worksheet(title=GOOGLE_LOG_WORKSHEET_NAME, rows="1", cols=3)
+    log_worksheet = spreadsheet.add_worksheet(title=GOOGLE_LOG_WORKSHEET_NAME, rows="1", cols=SYNC_STATE_COLUMN_COUNT)
     log_worksheet.update([["Timestamp (Local Time)", "Timestamp (UTC)", "Description"]])
     print(f"Created new log worksheet: '{GOOGLE_LOG_WORKSHEET_NAME}' with headers.")
 
+# The sync-state cells must be inside the grid before they can be read
+if log_worksheet.col_count < SYNC_STATE_COLUMN_COUNT or log_worksheet.row_count < SYNC_STATE_LAST_ROW:
+    log_worksheet.resize(
+        rows=max(log_worksheet.row_count, SYNC_STATE_LAST_ROW),
+        cols=max(log_worksheet.col_count, SYNC_STATE_COLUMN_COUNT),
+    )
+
+# --- Sync State ---
+watermark_value, orders_next_row_value, log_next_row_value, created_from_value = (
+    value_range.first()
+    for value_range in log_worksheet.batch_get(
+        [WATERMARK_CELL, ORDERS_NEXT_ROW_CELL, LOG_NEXT_ROW_CELL, CREATED_FROM_CELL], value_render_option='UNFORMATTED_VALUE'
+    )
+)
+# The saved state only describes orders that are still in the sheet, so an orders worksheet
+# holding just its header (newly created, or cleared by hand) means starting over with a full fetch
+if orders_worksheet_created or not orders_worksheet.get("A2:F2"):
+    print("Orders worksheet has no order rows. Ignoring saved sync state.")
+    watermark_value = created_from_value = None
+    orders_next_row = 2
+elif orders_next_row_value and int(orders_next_row_value) <= orders_worksheet.row_count + 1:
+    orders_next_row = int(orders_next_row_value)
+else:
+    # One-time scan for sheets synced before the cursor existed, or whose cursor points past the grid
+    orders_next_row = len(orders_worksheet.col_values(1)) + 1
+# The log cursor falls back to the same one-time scan
+log_next_row = int(log_next_row_value) if log_next_row_value else len(log_worksheet.col_values(1)) + 1
+
 # --- MODIFIED: Dynamic Fetch Logic ---
 all_orders = []
 new_orders_to_add = []
+last_order_number = 0
 
 try:
-    existing_order_numbers = orders_worksheet.col_values(fieldnames_flattened.index('order_number') + 1)[1:]
+    if watermark_value:
+        last_order_number = int(watermark_value)
+    else:
+        # One-time migration for sheets synced before the watermark cell existed
+        # Unformatted values come back as numbers, so no per-row string parsing is needed
+        # Column B is "ORDER NO"; row 1 is the header
+        existing_order_numbers = orders_worksheet.get("B2:B", value_render_option='UNFORMATTED_VALUE')
+        last_order_number = int(max((row[0] for row in existing_order_numbers if row and isinstance(row[0], (int, float))), default=0))
 
-    if not existing_order_numbers or all(not num.isdigit() for num in existing_order_numbers):
+    if not last_order_number:
         print("Worksheet is empty or contains no valid order numbers. Performing initial full fetch based on date.")
         created_from_param = INITIAL_FETCH_DATE_STR
-        
-        offset = 0
-        limit = 100
-        while True:
-            params = {
-                "offset": offset,
-                "limit": limit,
-                "createdFrom": created_from_param
-            }
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            page = response.json()
-            orders = page.get("items", [])
-            all_orders.extend(orders)
+        all_orders = asyncio.run(fetch_all({"createdFrom": created_from_param}))
 
-            if len(orders) < limit:
-                break
-            offset += limit
-        
         print(f"Successfully fetched {len(all_orders)} orders from initial fetch.")
         new_orders_to_add = all_orders
 
     else:
-        last_order_number_str = max([num for num in existing_order_numbers if num.isdigit()], key=int)
-        last_order_number = int(last_order_number_str)
-        print(f"Found {len(existing_order_numbers)} existing orders. Highest order number is {last_order_number}.")
-
-        limit = 100
-        offset = 0
-        while True:
-            params = {
-                "offset": offset,
-                "limit": limit,
-                "sortBy": "orderNumber",
-                "sortOrder": "asc"
-            }
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            page = response.json()
-            orders = page.get("items", [])
-            
-            if not orders:
-                break
+        print(f"Highest order number already in the sheet is {last_order_number}.")
 
-            newly_fetched_orders = [order for order in orders if order.get('orderNumber') and order.get('orderNumber') > last_order_number]
-            all_orders.extend(newly_fetched_orders)
+        # createdFrom is inclusive, so orders from that second come back again and are dropped by the order number check
+        params_base = {"createdFrom": created_from_value} if created_from_value else {}
+        all_orders = asyncio.run(fetch_newer_than(last_order_number, params_base))
 
-            if len(orders) < limit or not newly_fetched_orders:
-                break
-            
-            offset += limit
-        
         print(f"Successfully fetched {len(all_orders)} new orders.")
         new_orders_to_add = all_orders
         
@@ -171,113 +322,99 @@ except Exception as e:
     new_orders_to_add = []
 
 # --- Data Normalization and Flattening ---
+# Rows are built directly in fieldnames_flattened order and only ever hold str, int or None
 new_rows_for_flattened_sheet = []
 print("Processing new orders and preparing data for Google Sheet...")
-for order in new_orders_to_add:
-    raw_create_date = order.get("createDate")
-    parsed_create_date = parse_and_standardize_date(raw_create_date)
-    formatted_create_date = parsed_create_date.strftime("%d-%m-%Y %H:%M:%S") if parsed_create_date else raw_create_date
-
-    base_order_data = {
-        "create_date": formatted_create_date,
-        "order_number": order.get("orderNumber"),
-    }
+formatted_create_dates, latest_create_date = format_create_dates([order.get("createDate") for order in new_orders_to_add])
+for order, formatted_create_date in zip(new_orders_to_add, formatted_create_dates):
+    order_number = order.get("orderNumber")
+    items = order.get("items")
 
-    if not order.get("items"):
-        row_for_flattened = base_order_data.copy()
-        row_for_flattened.update({
-            "product_name": None, "category": None, "size": None, "color": None
-        })
-        new_rows_for_flattened_sheet.append(row_for_flattened)
+    if not items:
+        new_rows_for_flattened_sheet.append([formatted_create_date, order_number, None, None, None, None])
         continue
 
-    for item in order.get("items", []):
-        row_for_flattened = base_order_data.copy()
-        row_for_flattened.update({
-            "product_name": item.get("name"),
-            "category": None,
-            "size": None,
-            "color": None,
-        })
+    for item in items:
+        category = size = color = None
 
-        for opt in item.get("selectedOptions", []):
-            cleaned_option_name = normalize_option(opt.get("name", ""))
+        # selectedOptions may be missing or null on items without options
+        for opt in item.get("selectedOptions") or ():
+            cleaned_option_name = normalize_option(opt.get("name") or "")
             value = opt.get("value")
 
             if cleaned_option_name == "color":
-                row_for_flattened["color"] = value
+                color = value
             elif cleaned_option_name == "size":
-                row_for_flattened["size"] = value
+                size = value
             elif cleaned_option_name == "category":
-                row_for_flattened["category"] = value
+                category = value
 
-        row_for_flattened['category'] = row_for_flattened.get('category')
-        row_for_flattened['size'] = row_for_flattened.get('size')
-        row_for_flattened['color'] = row_for_flattened.get('color')
-
-        new_rows_for_flattened_sheet.append(row_for_flattened)
-
-# Create DataFrame
-flattened_df = pd.DataFrame(new_rows_for_flattened_sheet, columns=fieldnames_flattened)
-
-print("Applying robust cleaning for NaN/Inf/None values in data for JSON compliance...")
-def clean_dataframe_for_gspread(df_to_clean, id_cols, numeric_cols, target_cols):
-    df = df_to_clean.copy()
-    id_cols_exist = [col for col in id_cols if col in df.columns]
-    numeric_cols_exist = [col for col in numeric_cols if col in df.columns]
-
-    for col in df.columns:
-        if col in id_cols_exist:
-            df[col] = df[col].astype(str).replace('<NA>', None)
-            df[col] = df[col].apply(lambda x: None if pd.isna(x) or (isinstance(x, float) and np.isnan(x)) else x)
-        elif col in numeric_cols_exist:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-            df[col] = df[col].mask(df[col].isna(), None)
-            df[col] = df[col].replace([np.inf, -np.inf], None)
-        else:
-            df[col] = df[col].apply(lambda x: None if pd.isna(x) or (isinstance(x, float) and np.isnan(x)) else x)
-    return df[target_cols]
-
-flattened_df = clean_dataframe_for_gspread(flattened_df, ID_COLUMNS, NUMERIC_COLUMNS, fieldnames_flattened)
+        new_rows_for_flattened_sheet.append([formatted_create_date, order_number, item.get("name") or None, category, size, color])
 
 # --- MODIFIED: Sort output by 'order_number' from oldest to newest ---
 print("Sorting data by 'order_number' (oldest to newest)...")
-flattened_df['order_number_sortable'] = pd.to_numeric(flattened_df['order_number'], errors='coerce')
-flattened_df = flattened_df.sort_values(by='order_number_sortable', ascending=True).drop(columns='order_number_sortable')
+new_rows_for_flattened_sheet = sort_rows_by_order_number(new_rows_for_flattened_sheet)
 
 # --- Google Sheet Logic for Incremental Update ---
-if not flattened_df.empty:
-    final_data_for_flattened_sheet = flattened_df[fieldnames_flattened].values.tolist()
-
-    print(f"\n--- DEBUG: Sample of new data for flattened sheet (first row): {final_data_for_flattened_sheet[0]} ---")
-
-    for r_idx, row_list in enumerate(final_data_for_flattened_sheet):
-        for c_idx, val in enumerate(row_list):
-            if isinstance(val, float) and (np.isnan(val) or val == np.inf or val == -np.inf):
-                final_data_for_flattened_sheet[r_idx][c_idx] = None
-            elif val is pd.NA:
-                final_data_for_flattened_sheet[r_idx][c_idx] = None
-
-    print(f"Appending {len(final_data_for_flattened_sheet)} new rows to worksheet '{GOOGLE_ORDERS_WORKSHEET_NAME}'...")
-    orders_worksheet.append_rows(final_data_for_flattened_sheet, value_input_option='RAW')
-    print("Update successful!")
+# Orders, log entry and sync state all go out in a single values.batchUpdate request
+batch_update_data = []
+grid_requests = []
+if new_rows_for_flattened_sheet:
+    print(f"\n--- DEBUG: Sample of new data for flattened sheet (first row): {new_rows_for_flattened_sheet[0]} ---")
+
+    orders_end_row = orders_next_row + len(new_rows_for_flattened_sheet) - 1
+    new_watermark = max(last_order_number, max(order.get("orderNumber") or 0 for order in new_orders_to_add))
+    grid_requests.append(row_capacity_request(orders_worksheet, orders_end_row))
+
+    print(f"Writing {len(new_rows_for_flattened_sheet)} new rows to worksheet '{GOOGLE_ORDERS_WORKSHEET_NAME}'...")
+    batch_update_data += [
+        {
+            "range": absolute_range_name(GOOGLE_ORDERS_WORKSHEET_NAME, f"A{orders_next_row}:{rowcol_to_a1(orders_end_row, len(header_flattened))}"),
+            "values": new_rows_for_flattened_sheet,
+        },
+        {"range": absolute_range_name(GOOGLE_LOG_WORKSHEET_NAME, WATERMARK_CELL), "values": [[new_watermark]]},
+        {"range": absolute_range_name(GOOGLE_LOG_WORKSHEET_NAME, ORDERS_NEXT_ROW_CELL), "values": [[orders_end_row + 1]]},
+    ]
+    if latest_create_date:
+        batch_update_data.append({
+            "range": absolute_range_name(GOOGLE_LOG_WORKSHEET_NAME, CREATED_FROM_CELL),
+            "values": [[latest_create_date.astimezone(UTC).strftime(ECWID_DATE_FORMATS[0])]],
+        })
 
 else:
     print("No new orders found. Google Sheet is up to date.")
 
 # --- Log the write activity to the Log Sheet ---
-try:
-    current_time_local = datetime.now().astimezone(ZoneInfo("Africa/Lagos"))
-    current_time_utc = datetime.now(timezone.utc)
-    num_new_records_written = len(flattened_df)
-
-    log_entry_flattened = [
-        current_time_local.strftime(OUTPUT_DATE_FORMAT),
-        current_time_utc.strftime(OUTPUT_DATE_FORMAT),
-        f"Incremental update completed. Added {num_new_records_written} new records to '{GOOGLE_ORDERS_WORKSHEET_NAME}'."
-    ]
-    log_worksheet.append_row(log_entry_flattened, value_input_option='RAW')
+current_time_local = datetime.now().astimezone(LAGOS)
+current_time_utc = datetime.now(UTC)
+num_new_records_written = len(new_rows_for_flattened_sheet)
+
+log_entry_flattened = [
+    current_time_local.strftime(OUTPUT_DATE_FORMAT),
+    current_time_utc.strftime(OUTPUT_DATE_FORMAT),
+    f"Incremental update completed. Added {num_new_records_written} new records to '{GOOGLE_ORDERS_WORKSHEET_NAME}'."
+]
+# The state cells in column Z are written in the same batch, so the log grid must reach them too
+grid_requests.append(row_capacity_request(log_worksheet, max(log_next_row, SYNC_STATE_LAST_ROW)))
+batch_update_data += [
+    {
+        "range": absolute_range_name(GOOGLE_LOG_WORKSHEET_NAME, f"A{log_next_row}:{rowcol_to_a1(log_next_row, len(log_entry_flattened))}"),
+        "values": [log_entry_flattened],
+    },
+    {"range": absolute_range_name(GOOGLE_LOG_WORKSHEET_NAME, LOG_NEXT_ROW_CELL), "values": [[log_next_row + 1]]},
+]
 
-    print(f"Logged write activity to '{GOOGLE_LOG_WORKSHEET_NAME}'.")
+try:
+    # Both worksheets are grown, when needed, in one request ahead of the write
+    grid_requests = [request for request in grid_requests if request]
+    if grid_requests:
+        spreadsheet.batch_update({"requests": grid_requests})
+    spreadsheet.values_batch_update(body={"valueInputOption": "RAW", "data": batch_update_data})
 except Exception as e:
-    print(f"ERROR: Could not log write activity to Google Sheet: {e}")
\ No newline at end of file
+    print(f"ERROR: Could not write to Google Sheet: {e}")
+    raise
+
+if new_rows_for_flattened_sheet:
+    print("Update successful!")
+    print(f"Recorded highest order number {new_watermark} in '{GOOGLE_LOG_WORKSHEET_NAME}'!{WATERMARK_CELL}.")
+print(f"Logged write activity to '{GOOGLE_LOG_WORKSHEET_NAME}'.")
\ No newline at end of file